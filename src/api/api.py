@@ -1,6 +1,21 @@
+import os
+
+# Tesseract reads its OpenMP thread limit at load time, so set it before anything spawns it
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
 from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from src.config.config import get_config
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # fail fast on a misconfigured environment instead of inside an OCR worker
+    get_config()
+    yield
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 @app.get("/ingest")
 def read_root():
@@ -0,0 +1,21 @@
+import os
+from pydantic import Field
+from functools import lru_cache
+from pydantic_settings import BaseSettings
+
+
+class Config(BaseSettings):
+    """Settings read from the environment."""
+
+    FULL_FILE_MARKDOWN_FOLDER: str
+    BUCKET_URL: str
+
+    # OCR is CPU bound and Tesseract threads internally, so keep the pool small
+    MAX_WORKERS: int = Field(default=max(1, (os.cpu_count() or 1) // 4), ge=1)
+
+
+@lru_cache(maxsize=1)
+def get_config() -> Config:
+    """Read and validate the settings once per process."""
+
+    return Config()
\ No newline at end of file
@@ -1,84 +1,227 @@
 import os
+import json
 import time
-from src.utils.utils import *
+import threading
+import multiprocessing
+import pypdfium2 as pdfium
+from itertools import islice
+from src.config.config import get_config
+from docling.datamodel.base_models import InputFormat
+from concurrent.futures.process import BrokenProcessPool
+from concurrent.futures import Future, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from src.utils.utils import (
+    get_pdf_pages,
+    get_page_bytes,
+    has_text_layer,
+    create_page_stream,
+    convert_text_to_markdown,
+    create_tesseract_converter,
+    concat_markdown_pages_into_file,
+    put_markdown_file_into_oci_bucket,
+)
+
+# OCR workers shared by every PDF, so the converters they load stay warm
+_ocr_executor = None
+_ocr_executor_lock = threading.Lock()
+
+# PDFium is not thread-safe, even across documents, so callers in the parent take turns
+_pdfium_lock = threading.Lock()
+
+
+def _init_worker():
+    """Load the Docling converter once per worker process."""
+
+    # one OpenMP thread per Tesseract run, the pool already spreads pages across cores
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+    # load the layout, table and OCR models now instead of on the first page,
+    # through the same cache key '_convert_page' uses for scanned pages
+    create_tesseract_converter(force_full_page_ocr=True).initialize_pipeline(InputFormat.PDF)
+
+
+def _get_ocr_executor() -> ProcessPoolExecutor:
+    """Return the OCR process pool, starting it on first use."""
+
+    global _ocr_executor
+
+    with _ocr_executor_lock:
+
+        if _ocr_executor is None:
+            # forkserver, since forking a multi-threaded server can copy a held lock into the workers
+            _ocr_executor = ProcessPoolExecutor(
+                max_workers=get_config().MAX_WORKERS,
+                mp_context=multiprocessing.get_context("forkserver"),
+                initializer=_init_worker
+            )
+
+        return _ocr_executor
+
+
+def _discard_ocr_executor(executor: ProcessPoolExecutor):
+    """Drop a broken OCR process pool so the next PDF starts a new one."""
+
+    global _ocr_executor
+
+    with _ocr_executor_lock:
+
+        if _ocr_executor is executor:
+            _ocr_executor = None
+
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _convert_page(
+        page_bytes: bytes,
+        page_name: str,
+        page_number: int
+) -> tuple[int, str]:
+    """Convert a single PDF page into Markdown inside a worker process."""
+
+    page_stream = create_page_stream(page_bytes, page_name)
+
+    # pages with a text layer only OCR their bitmaps, so born-digital pages skip Tesseract
+    # while a scan carrying a text stamp, like a signature footer, keeps its scanned body
+    converter = create_tesseract_converter(force_full_page_ocr=not has_text_layer(page_bytes))
+
+    md_generated = convert_text_to_markdown(page_stream, converter)
+
+    return page_number, md_generated
+
+
+def _submit_page(
+        executor: ProcessPoolExecutor,
+        pdf_pages: pdfium.PdfDocument,
+        pdf_name: str,
+        page_number: int,
+        timings: dict
+) -> Future:
+    """Split a page out of the PDF and queue its conversion in the pool."""
+
+    with _pdfium_lock:
+
+        start = time.perf_counter()
+        page_bytes = get_page_bytes(pdf_pages, page_number - 1)
+
+        # splitting is part of the extraction, even though it overlaps the OCR window
+        timings["extract"] += time.perf_counter() - start
+
+    return executor.submit(_convert_page, page_bytes, f"{pdf_name}-{page_number}", page_number)
+
 
 def pdf_to_docling_with_ocr(pdf_path: str) -> list:
     """Convert a PDF to images and perform Docling with OCR on each page."""
 
-    page_pdf_folder = os.getenv("PAGE_PDF_FOLDER")
-    markdown_folder = os.getenv("MARKDOWN_PAGE_FOLDER")
-    full_file_markdown_folder = os.getenv("FULL_FILE_MARKDOWN_FOLDER")
+    config = get_config()
 
     # get the PDF name
     pdf_name, _ = os.path.splitext(os.path.basename(pdf_path))
 
     print(f"Converting {pdf_name} to images")
 
+    # seconds spent on every stage, printed once at the end,
+    # extract and ocr overlap since pages are split while earlier ones are OCR'd
+    timings = {"extract": 0.0, "ocr": 0.0, "concat": 0.0, "upload": 0.0}
+
+    executor = _get_ocr_executor()
+    futures = set()
+
     # pages from the PDF and store in the image folder
-    start_pdf_pages_extraction = time.time()
+    start = time.perf_counter()
+
+    with _pdfium_lock:
+        pdf_pages = get_pdf_pages(pdf_path)
+        page_count = len(pdf_pages)
+
+    try:
+
+        timings["extract"] = time.perf_counter() - start
+
+        if page_count == 0:
+            print(f"No pages found in {pdf_path}")
+            return []
+
+        results = []
+        markdown_text_pages = []
+
+        print(f"Converting {pdf_name} pages into text using Docling")
+
+        # docling ingestion from every PDF page, one page per worker
+        start = time.perf_counter()
+
+        # pages converted out of order, waiting for the previous ones
+        markdown_by_page = {}
+        next_page_number = 1
+
+        # split the pages lazily and keep only a bounded number queued in the pool,
+        # so splitting overlaps with OCR and memory does not grow with the page count
+        page_numbers = iter(range(1, page_count + 1))
+        max_pages_in_flight = 2 * config.MAX_WORKERS
+
+        for page_number in islice(page_numbers, max_pages_in_flight):
+            futures.add(_submit_page(executor, pdf_pages, pdf_name, page_number, timings))
+
+        while futures:
 
-    pdf_pages = get_pdf_pages(pdf_path)
+            done, futures = wait(futures, return_when=FIRST_COMPLETED)
 
-    end_pdf_pages_extraction = time.time()
-    print("Time to process: ", end_pdf_pages_extraction - start_pdf_pages_extraction, " seconds")
+            # refill the pool before collecting, so the workers never wait on the parent
+            for page_number in islice(page_numbers, len(done)):
+                futures.add(_submit_page(executor, pdf_pages, pdf_name, page_number, timings))
 
-    if len(pdf_pages) == 0:
-        print(f"No pages found in {pdf_path}")
-        return []
+            for future in done:
 
-    results = []
-    markdown_text_pages = []
+                page_number, md_generated = future.result()
+                markdown_by_page[page_number] = md_generated
 
-    converter = create_tesseract_converter()
+            # collect every page that is ready, in order
+            while next_page_number in markdown_by_page:
 
-    print(f"Converting {pdf_name} pages into text using Docling")
+                # declaring the page name
+                page_name = f"{pdf_name}-{next_page_number}"
 
-    # enumerate to every page
-    for i, pdf_page in enumerate(pdf_pages):
+                markdown_text_pages.append(markdown_by_page.pop(next_page_number))
+                next_page_number += 1
 
-        # declaring page number
-        page_number = i + 1
+                # put every page from the PDF Markdown file into oci bucket
+                # put_file_page_into_oci_bucket(page_path, pdf_name, i + 1)
 
-        # declaring the page name
-        page_name = f"{pdf_name}-{page_number}"
+                results.append((pdf_name, page_name, "OK"))
 
-        # insert the page in a folder
-        pdf_page_path = create_page_path(pdf_page, page_pdf_folder, pdf_name, page_name)
+    except BaseException as e:
 
-        # docling ingestion from PDF page
-        start_pdf_pages_ingestion = time.time()
+        # stop the pages of this PDF still queued in the shared pool
+        for future in futures:
+            future.cancel()
 
-        md_generated = convert_text_to_markdown(pdf_page_path, converter)
-        markdown_text_pages.append(md_generated)
+        # a crashed worker breaks the whole pool
+        if isinstance(e, BrokenProcessPool):
+            _discard_ocr_executor(executor)
 
-        end_pdf_pages_ingestion = time.time()
-        print("Time to process: ", end_pdf_pages_ingestion - start_pdf_pages_ingestion, " seconds")
+        raise
 
+    finally:
 
-        # declaring a page path in Markdown and save in markdown_folder
-        save_temporary_md_file(markdown_folder, pdf_name, page_name, md_generated)
+        with _pdfium_lock:
+            pdf_pages.close()
 
-        # put every page from the PDF Markdown file into oci bucket
-        # put_file_page_into_oci_bucket(page_path, pdf_name, i + 1)
+    timings["ocr"] = time.perf_counter() - start
 
-        results.append((pdf_name, page_name, "OK"))
+    # concat every page in a single file '.md'
+    start = time.perf_counter()
 
-        # concat every page in a single file '.md'
-        start_concat_markdown_pages = time.time()
+    full_markdown_file = concat_markdown_pages_into_file(markdown_text_pages, config.FULL_FILE_MARKDOWN_FOLDER+"-docling", pdf_name + ".md")
 
-        full_markdown_file = concat_markdown_pages_into_file(markdown_text_pages, full_file_markdown_folder+"-docling", pdf_name + ".md")
+    timings["concat"] = time.perf_counter() - start
 
-        end_concat_markdown_pages = time.time()
-        print("Time to process: ", end_concat_markdown_pages - start_concat_markdown_pages, " seconds")
+    print(f"Saving Markdown file: {pdf_name}.md")
 
-        print(f"Saving Markdown file: {pdf_name}.md")
+    # put the PDF in Markdown into oci bucket
+    start = time.perf_counter()
 
-        # put the PDF in Markdown into oci bucket
-        start_put_markdown_file_into_oci_bucket = time.time()
+    put_markdown_file_into_oci_bucket(full_markdown_file, pdf_name, "docling")
 
-        put_markdown_file_into_oci_bucket(full_markdown_file, pdf_name, "docling")
+    timings["upload"] = time.perf_counter() - start
 
-        end_put_markdown_file_into_oci_bucket = time.time()
-        print("Time to process: ", end_put_markdown_file_into_oci_bucket - start_put_markdown_file_into_oci_bucket, " seconds")
+    print(f"Time to process {pdf_name}: {json.dumps(timings)}")
 
     return results
\ No newline at end of file